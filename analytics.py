@@ -0,0 +1,117 @@
+import json
+import os
+import time
+from collections import Counter
+from datetime import date, timedelta
+from typing import Dict, List
+
+# Разрезы, по которым считаются запросы
+DIMENSIONS = ("commands", "groups", "courses", "weekdays", "hours")
+
+
+class UsageAnalytics:
+    """
+    Счётчики использования бота: команды, группы, курсы, дни недели и часы.
+    В обработчике — только увеличение счётчика в памяти (все обработчики выполняются
+    в одном потоке event loop, блокировки не нужны). Раз в интервал накопленное
+    сбрасывается в файл за текущий день: analytics/usage-ГГГГММДД.json.
+    """
+
+    def __init__(self, directory: str = "analytics"):
+        self.directory = directory
+        self._pending = self._empty()
+
+    @staticmethod
+    def _empty() -> Dict[str, Counter]:
+        return {dimension: Counter() for dimension in DIMENSIONS}
+
+    @staticmethod
+    def course_label(course) -> str:
+        """Курс, который выбрал студент, в одном виде: 2, "2" и "2 курс" → "2 курс" """
+        text = str(course).strip()
+        return f"{text.split()[0]} курс" if text else ""
+
+    def track(self, command: str, group: str = None, course=None) -> None:
+        """course — курс, выбранный пользователем (не ключ EXCEL_URLS, который для базы 11 сдвинут на +1)"""
+        now = time.localtime()
+        pending = self._pending
+        pending["commands"][command] += 1
+        pending["weekdays"][str(now.tm_wday)] += 1
+        pending["hours"][str(now.tm_hour)] += 1
+        if group:
+            pending["groups"][str(group)] += 1
+        if course:
+            pending["courses"][self.course_label(course)] += 1
+
+    def take_pending(self) -> Dict[str, Counter]:
+        """Забирает накопленное и начинает копить заново (вызывается из event loop)"""
+        pending, self._pending = self._pending, self._empty()
+        return pending
+
+    def restore_pending(self, pending: Dict[str, Counter]) -> None:
+        """Возвращает неудачно сброшенные счётчики, чтобы они ушли со следующим сбросом"""
+        for dimension in DIMENSIONS:
+            self._pending[dimension].update(pending[dimension])
+
+    def _day_path(self, day: date) -> str:
+        return os.path.join(self.directory, f"usage-{day.strftime('%Y%m%d')}.json")
+
+    def _load_day(self, day: date) -> Dict[str, Counter]:
+        path = self._day_path(day)
+        totals = self._empty()
+        if os.path.exists(path):
+            try:
+                with open(path, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+                for dimension in DIMENSIONS:
+                    totals[dimension].update(data.get(dimension, {}))
+            except (json.JSONDecodeError, IOError):
+                pass
+        return totals
+
+    def flush(self, pending: Dict[str, Counter]) -> None:
+        """Дописывает счётчики в файл текущего дня (можно вызывать в потоке)"""
+        if not any(pending.values()):
+            return
+
+        os.makedirs(self.directory, exist_ok=True)
+        today = date.today()
+        totals = self._load_day(today)
+        for dimension in DIMENSIONS:
+            totals[dimension].update(pending[dimension])
+
+        path = self._day_path(today)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({dimension: dict(totals[dimension]) for dimension in DIMENSIONS}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, path)
+
+    def totals(self, days: int = 7) -> Dict[str, Counter]:
+        """Сумма за последние days дней вместе с ещё не сброшенным"""
+        totals = self._empty()
+        for offset in range(days):
+            day_totals = self._load_day(date.today() - timedelta(days=offset))
+            for dimension in DIMENSIONS:
+                totals[dimension].update(day_totals[dimension])
+        for dimension in DIMENSIONS:
+            totals[dimension].update(self._pending[dimension])
+        return totals
+
+    def top_groups(self, limit: int, days: int = 7) -> List[str]:
+        return [group for group, _ in self.totals(days)["groups"].most_common(limit)]
+
+    def report(self, limit: int = 5) -> str:
+        totals = self.totals()
+        weekdays = ["Пн", "Вт", "Ср", "Чт", "Пт", "Сб", "Вс"]
+
+        def top(dimension, label=str):
+            return ", ".join(f"{label(key)}: {count}" for key, count in totals[dimension].most_common(limit)) or "—"
+
+        return "\n".join([
+            "📈 Использование за 7 дней:",
+            f"Команды: {top('commands')}",
+            f"Группы: {top('groups')}",
+            f"Курсы: {top('courses')}",
+            f"Дни: {top('weekdays', lambda d: weekdays[int(d)])}",
+            f"Часы: {top('hours', lambda h: f'{h}:00')}"
+        ])
@@ -1,12 +1,32 @@
+import asyncio
 import logging
+import os
+import re
+import tempfile
+from typing import Iterable, Iterator, Optional, Dict, Any
 
-from telegram import Update, ReplyKeyboardMarkup, KeyboardButton
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
+from telegram import Update, ReplyKeyboardMarkup, KeyboardButton, InlineKeyboardMarkup, InlineKeyboardButton
+from telegram.ext import Application, CommandHandler, MessageHandler, CallbackQueryHandler, filters, ContextTypes
 
-from config import BOT_TOKEN, EXCEL_URLS
+from analytics import UsageAnalytics
+from config import BOT_TOKEN, EXCEL_URLS, ADMIN_IDS, PROFILE_SAMPLE_RATE, PROFILE_WINDOW_SECONDS, PROFILE_DUMP_PATH, \
+    ANALYTICS_DIR, ANALYTICS_FLUSH_SECONDS, PREWARM_TOP_GROUPS, SCHEDULE_CACHE_SIZE, ICS_URL_REFRESH_SECONDS
 from exel_parser import ExcelParser
+from group_index import GroupIndex
+from ics_export import IcsCache
+from profiler import SamplingProfiler
+from schedule_loader import ScheduleLoader
+from update_shcedule import install_schedule_file
 from user_manager import UserManager
 
+# Максимальная длина одного сообщения Telegram (в единицах UTF-16)
+TELEGRAM_MESSAGE_LIMIT = 4096
+
+
+def message_length(text: str) -> int:
+    """Длина текста так, как её считает Telegram: в единицах UTF-16 (эмодзи вне BMP — за две)"""
+    return len(text.encode('utf-16-le')) // 2
+
 logging.basicConfig(
     level=logging.INFO,
     format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
@@ -23,9 +43,39 @@ class ScheduleBot:
         # Парсер Excel-файлов для расписания
         self.parser = ExcelParser()
 
+        # Индекс «группа → файл» по всем файлам расписания
+        self.group_index = GroupIndex(self.parser)
+
+        # Готовые .ics по группам и их file_id в Telegram; собираются в фоне на каждый новый снимок
+        self.ics_cache = IcsCache()
+        self._ics_task = None
+        self._ics_dirty = False
+
+        # Первая сборка — до запуска бота, дальше индекс обновляется в фоне (refresh_index)
+        self._index_task = None
+        self.group_index.refresh()
+
         # Временные данные для выбора курса/группы
         self.temp_data = {}
 
+        # Выборочный профайлер тяжёлой синхронной работы (включается PROFILE_SAMPLE_RATE или /profile on):
+        # разбор расписания и поиск групп в файле
+        self.profiler = SamplingProfiler(PROFILE_SAMPLE_RATE, PROFILE_WINDOW_SECONDS)
+        self.find_groups = self.profiler.wrap(self.parser.find_groups_in_excel)
+
+        # Разбор расписания в потоке; одинаковые одновременные запросы ждут один разбор
+        self.loader = ScheduleLoader(self.profiler.wrap(self.parser.get_group_schedule), SCHEDULE_CACHE_SIZE)
+
+        # Счётчики использования: какие группы, курсы и команды популярны
+        self.analytics = UsageAnalytics(ANALYTICS_DIR)
+
+        # Загруженные админами файлы, проверенные и ждущие подтверждения: user_id → данные
+        self.pending_uploads = {}
+
+    @staticmethod
+    def is_admin(user_id: int) -> bool:
+        return user_id in ADMIN_IDS
+
     # 🔥 NEW: выбор базы (9/11)
     @staticmethod
     def get_base_keyboard() -> ReplyKeyboardMarkup:
@@ -78,12 +128,17 @@ class ScheduleBot:
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         user_id = update.effective_user.id
         saved_choice = self.user_manager.get_user_choice(user_id)
+        self.analytics.track("start")
 
         print(f"🔍 START: user_id={user_id}, saved_choice={saved_choice}")
 
         if saved_choice and saved_choice.get("course") and saved_choice.get("group") and saved_choice.get("base"):
             # проверяем время обновления файла, но учитываем, что для базы 11 реальные файлы могут быть на курс +1
-            excel_course = self._compute_excel_course(saved_choice["course"], saved_choice["base"])
+            entry = self.find_group(saved_choice["group"], saved_choice["course"], saved_choice["base"])
+            if entry:
+                excel_course = entry["course_key"]
+            else:
+                excel_course = self._compute_excel_course(saved_choice["course"], saved_choice["base"])
             should_update = self.user_manager.should_update_schedule(user_id, excel_course)
             print(f"🔄 Проверка обновления: {should_update} (excel_course={excel_course})")
 
@@ -155,6 +210,7 @@ class ScheduleBot:
 
         # Получаем базу
         base = self.temp_data.get(user_id, {}).get("base", "9")
+        self.analytics.track("course", course=course_num)
 
         # Выбираем Excel-файл
         if base == "11":
@@ -170,7 +226,7 @@ class ScheduleBot:
             return
 
         # Получаем группы
-        groups = self.parser.find_groups_in_excel(excel_url, excel_course_key)
+        groups = self.find_groups(excel_url, excel_course_key)
         if not groups:
             await update.message.reply_text("❌ Группы не найдены в расписании")
             return
@@ -224,6 +280,7 @@ class ScheduleBot:
         excel_course_key = self._compute_excel_course(course, base)
 
         self.user_manager.save_user_choice(user_id, str(course), group, base)
+        self.analytics.track("select_group", group=group, course=course)
         if user_id in self.temp_data:
             del self.temp_data[user_id]
 
@@ -244,26 +301,25 @@ class ScheduleBot:
         group = user_choice["group"]
         base = user_choice.get("base", "9")
 
-        excel_course_key = self._compute_excel_course(course, base)
-        excel_url = EXCEL_URLS.get(excel_course_key)
+        entry = self.find_group(group, course, base)
+        if not entry:
+            await update.message.reply_text("❌ Файл расписания не найден для выбранного курса")
+            return
+        excel_url = entry["excel_url"]
+        self.analytics.track("schedule", group=group, course=course)
 
         await update.message.reply_text(f"🔍 Ищу расписание {group}... ")
 
-        result_data = self.parser.get_group_schedule(excel_url, group)
+        result_data = await self.loader.get_group_schedule(excel_url, group, entry["column"])
 
         if result_data and isinstance(result_data, dict) and "schedule" in result_data:
-            formatted = self.format_schedule(result_data, group)
-            if len(formatted) > 4096:
-                parts = [formatted[i:i + 4096] for i in range(0, len(formatted), 4096)]
-                for part in parts:
-                    await update.message.reply_text(part)
-            else:
-                await update.message.reply_text(formatted)
+            await self.send_chunks(update.message, self.format_schedule(result_data, group))
         else:
             await update.message.reply_text(f"❌ Не удалось загрузить расписание для {group}")
 
     async def handle_change_group(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
         user_id = update.effective_user.id
+        self.analytics.track("change_group")
 
         # Удаляем только выбор курса и группы, но оставляем базу (если была)
         prev_base = self.user_manager.get_user_choice(user_id).get("base", "")
@@ -278,15 +334,374 @@ class ScheduleBot:
             await update.message.reply_text("Выбери базу обучения:", reply_markup=self.get_base_keyboard())
 
 
-    def format_schedule(self, data: dict, group: str) -> str:
+    # 🔥 NEW: /profile — управление профайлером и отчёт по горячим функциям (только для админов)
+    async def handle_profile(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not self.is_admin(update.effective_user.id):
+            return
+
+        args = context.args or []
+        action = args[0].lower() if args else ""
+
+        if action == "on":
+            try:
+                rate = float(args[1]) if len(args) > 1 else 0.1
+            except ValueError:
+                await update.message.reply_text("❌ Доля должна быть числом, например: /profile on 0.1")
+                return
+            self.profiler.set_sample_rate(rate)
+            await update.message.reply_text(f"🔬 Профайлер включён, доля вызовов: {self.profiler.sample_rate:.0%}")
+        elif action == "off":
+            self.profiler.set_sample_rate(0)
+            await update.message.reply_text("🔬 Профайлер выключен")
+        elif action == "reset":
+            self.profiler.reset()
+            await update.message.reply_text("🔬 Статистика профайлера сброшена")
+        elif action == "dump":
+            if self.profiler.dump(PROFILE_DUMP_PATH):
+                await update.message.reply_text(f"💾 Статистика сохранена в {PROFILE_DUMP_PATH}")
+            else:
+                await update.message.reply_text("Данных пока нет")
+        else:
+            await update.message.reply_text(self.profiler.report())
+
+    # 🔥 NEW: админ присылает .xlsx — проверяем в фоне и предлагаем заменить расписание
+    async def handle_document(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user_id = update.effective_user.id
+        if not self.is_admin(user_id):
+            return
+
+        document = update.message.document
+        # Имя из Telegram используется только для отчёта и сопоставления — без путей
+        file_name = os.path.basename(document.file_name or "schedule.xlsx")
+
+        temp_file = tempfile.NamedTemporaryFile(delete=False, suffix='.xlsx')
+        temp_file.close()
+        tg_file = await document.get_file()
+        await tg_file.download_to_drive(temp_file.name)
+
+        await update.message.reply_text(f"⏳ Файл {file_name} получен, проверяю...")
+
+        # Проверка идёт в фоне — обработка сообщений остальных пользователей не ждёт
+        context.application.create_task(self._validate_upload(update.message, user_id, temp_file.name, file_name))
+
+    async def _validate_upload(self, message, user_id: int, path: str, file_name: str) -> None:
+        try:
+            report = await asyncio.to_thread(self._compare_upload, path, file_name)
+        except Exception as e:
+            # Задача фоновая — без этого ошибка ушла бы только в лог, а файл остался бы во временной папке
+            print(f"❌ Ошибка проверки загруженного файла {file_name}: {e}")
+            self._remove_file(path)
+            await message.reply_text(f"❌ Не удалось проверить файл {file_name}: {e}")
+            return
+
+        if not report:
+            os.unlink(path)
+            await message.reply_text("❌ В файле не найдена строка с названиями групп")
+            return
+
+        text = self.format_upload_report(report, file_name)
+        if not report["course_key"]:
+            os.unlink(path)
+            await message.reply_text(text + "\n\n❌ Не удалось понять, какой файл расписания он заменяет")
+            return
+
+        if EXCEL_URLS[report["course_key"]].startswith("http"):
+            # Удалённый файл отсюда не перезаписать, а подмена адреса только в памяти пропала бы после перезапуска
+            os.unlink(path)
+            await message.reply_text(text + "\n\n❌ Этот курс загружается по ссылке — замените файл в источнике")
+            return
+
+        # Новая загрузка от того же админа вытесняет предыдущую
+        previous = self.pending_uploads.pop(user_id, None)
+        if previous and os.path.exists(previous["path"]):
+            os.unlink(previous["path"])
+
+        self.pending_uploads[user_id] = {"path": path, "course_key": report["course_key"], "file_name": file_name}
+
+        keyboard = InlineKeyboardMarkup([[
+            InlineKeyboardButton("✅ Заменить", callback_data="upload:apply"),
+            InlineKeyboardButton("❌ Отмена", callback_data="upload:cancel")
+        ]])
+        await message.reply_text(text, reply_markup=keyboard)
+
+    @staticmethod
+    def _compare_upload(path: str, file_name: str) -> Optional[Dict[str, Any]]:
+        """
+        Разбирает загруженный файл и текущий файл, который он заменит (выполняется в потоке).
+        Свой ExcelParser — чтобы не делить кэш и временные файлы с обработчиками.
+        """
+        parser = ExcelParser()
+        new_schedules = parser.get_all_group_schedules(path)
+        if not new_schedules:
+            parser.cleanup_temp_files()
+            return None
+
+        # Заменяемый файл — тот, с которым больше всего общих групп, иначе файл с тем же именем
+        course_key, best_overlap = None, 0
+        for key, url in EXCEL_URLS.items():
+            overlap = len(set(parser.find_groups_in_excel(url, key)) & set(new_schedules))
+            if overlap > best_overlap:
+                course_key, best_overlap = key, overlap
+
+        if not course_key:
+            for key, url in EXCEL_URLS.items():
+                if re.split(r'[\\/]', url)[-1] == file_name:
+                    course_key = key
+
+        old_schedules = parser.get_all_group_schedules(EXCEL_URLS[course_key]) if course_key else None
+        parser.cleanup_temp_files()
+
+        return {
+            "course_key": course_key,
+            "new": {group: data["stats"] for group, data in new_schedules.items()},
+            "old": {group: data["stats"] for group, data in (old_schedules or {}).items()}
+        }
+
+    @staticmethod
+    def format_upload_report(report: Dict[str, Any], file_name: str) -> str:
+        new, old = report["new"], report["old"]
+
+        lines = [f"📥 Файл: {file_name}"]
+        if report["course_key"]:
+            lines.append(f"🎯 Заменит: {report['course_key']} ({EXCEL_URLS[report['course_key']]})")
+        lines.append(f"👥 Групп: {len(new)} (было {len(old)})")
+
+        added = [g for g in new if g not in old]
+        removed = [g for g in old if g not in new]
+        if added:
+            lines.append(f"➕ Новые группы: {', '.join(added)}")
+        if removed:
+            lines.append(f"➖ Пропали группы: {', '.join(removed)}")
+
+        total = sum(stats["total"] for stats in new.values())
+        distant = sum(stats["distant"] for stats in new.values())
+        self_study = sum(stats["self_study"] for stats in new.values())
+        lines.append(f"📊 Пар: {total}, дистант: {distant}, самостоятельных: {self_study}")
+
+        empty = [g for g, stats in new.items() if not stats["total"]]
+        if empty:
+            lines.append(f"⚠️ Группы без пар: {', '.join(empty)}")
+
+        changed = [f"{g}: {old[g]['total']} → {stats['total']}" for g, stats in new.items()
+                   if g in old and old[g]["total"] != stats["total"]]
+        if changed:
+            lines.append("\n🔁 Изменилось число пар:")
+            lines.extend(changed[:40])
+            if len(changed) > 40:
+                lines.append(f"... и ещё {len(changed) - 40}")
+
+        return "\n".join(lines)
+
+    async def handle_upload_decision(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        query = update.callback_query
+        await query.answer()
+
+        user_id = query.from_user.id
+        if not self.is_admin(user_id):
+            return
+
+        pending = self.pending_uploads.pop(user_id, None)
+        if not pending:
+            await query.edit_message_reply_markup(reply_markup=None)
+            return
+
+        if query.data == "upload:cancel":
+            os.unlink(pending["path"])
+            await query.edit_message_text(query.message.text + "\n\n❌ Замена отменена")
+            return
+
+        course_key = pending["course_key"]
+        target = EXCEL_URLS[course_key]
+
+        try:
+            await asyncio.to_thread(install_schedule_file, pending["path"], target)
+        except Exception as e:
+            # Старый файл не тронут (os.replace не случился) — убираем загрузку и недописанную копию
+            print(f"❌ Ошибка замены расписания {target}: {e}")
+            self._remove_file(pending["path"])
+            self._remove_file(f"{target}.uploading")
+            await query.edit_message_text(query.message.text + f"\n\n❌ Не удалось заменить расписание: {e}")
+            return
+        self._remove_file(pending["path"])
+
+        await self.refresh_caches(target)
+
+        await query.edit_message_text(query.message.text + f"\n\n✅ Расписание для {course_key} обновлено")
+
+    @staticmethod
+    def _remove_file(path: str) -> None:
+        """Удаляет временный файл, если он есть; ошибка удаления только пишется в лог"""
+        try:
+            if os.path.exists(path):
+                os.unlink(path)
+        except OSError as e:
+            print(f"⚠️ Не удалось удалить {path}: {e}")
+
+    async def refresh_caches(self, excel_url: str) -> None:
+        """Сбрасывает всё, что закэшировано по файлу расписания; индекс пересобирается в потоке"""
+        self.parser.invalidate(excel_url)
+        self.group_index.invalidate()
+        if await asyncio.to_thread(self.group_index.refresh):
+            self.schedule_ics_rebuild()
+
+    def refresh_index(self) -> None:
+        """
+        Если индекс устарел — запускает его пересборку в потоке и сразу возвращается:
+        обработчики не ждут чтения файлов и пока отвечают по старому индексу.
+        Здесь только сверка версий файлов (os.stat), без открытия книг.
+        """
+        if self._index_task and not self._index_task.done():
+            return
+        if not self.group_index.is_stale():
+            return
+        self._index_task = asyncio.get_running_loop().create_task(self._rebuild_index())
+
+    async def _rebuild_index(self) -> None:
+        if await asyncio.to_thread(self.group_index.refresh):
+            self.schedule_ics_rebuild()
+
+    def schedule_ics_rebuild(self) -> None:
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            # Бот ещё не запущен — сборку запустит post_init
+            return
+
+        if self._ics_task and not self._ics_task.done():
+            # Сборка уже идёт — после неё пройдём ещё раз по свежим файлам
+            self._ics_dirty = True
+            return
+        self._ics_task = loop.create_task(self.rebuild_ics())
+
+    async def rebuild_ics(self) -> None:
+        while True:
+            self._ics_dirty = False
+            schedules = await asyncio.to_thread(self._parse_all_schedules, dict(EXCEL_URLS))
+            rebuilt = self.ics_cache.update_all(schedules)
+            print(f"📆 Календари: групп {len(schedules)}, пересобрано {rebuilt}")
+            if not self._ics_dirty:
+                break
+
+    @staticmethod
+    def _parse_all_schedules(excel_urls: dict) -> dict:
+        """Расписания всех групп всех файлов: {(ключ курса, группа): результат}. Выполняется в потоке"""
+        parser = ExcelParser()
+        schedules = {}
+        for course_key, excel_url in excel_urls.items():
+            for group, result in (parser.get_all_group_schedules(excel_url) or {}).items():
+                schedules[(course_key, group)] = result
+        parser.cleanup_temp_files()
+        return schedules
+
+    async def post_init(self, application: Application) -> None:
+        self.schedule_ics_rebuild()
+        application.create_task(self.revalidate_url_ics_loop())
+        application.create_task(self.prewarm())
+        application.create_task(self.flush_analytics_loop())
+
+    async def revalidate_url_ics_loop(self) -> None:
+        """
+        Файлы по URL меняются незаметно для индекса (их версия — только адрес), поэтому
+        календари пересобираются по таймеру. Пересборка сверяет хэши расписаний,
+        так что .ics и file_id сбрасываются только у групп, которые правда изменились.
+        """
+        while True:
+            await asyncio.sleep(ICS_URL_REFRESH_SECONDS)
+            if any(url.startswith('http') for url in EXCEL_URLS.values()):
+                self.schedule_ics_rebuild()
+
+    async def post_shutdown(self, application: Application) -> None:
+        self.analytics.flush(self.analytics.take_pending())
+
+    async def flush_analytics_loop(self) -> None:
+        while True:
+            await asyncio.sleep(ANALYTICS_FLUSH_SECONDS)
+            pending = self.analytics.take_pending()
+            try:
+                await asyncio.to_thread(self.analytics.flush, pending)
+            except Exception as e:
+                # Возвращаем счётчики обратно — попробуем записать в следующий раз
+                self.analytics.restore_pending(pending)
+                print(f"⚠️ Не удалось сохранить аналитику: {e}")
+
+    async def prewarm(self) -> None:
+        """Заранее разбирает расписания самых популярных групп, чтобы первые запросы шли из кэша"""
+        groups = self.analytics.top_groups(PREWARM_TOP_GROUPS)
+        warmed = 0
+        for group in groups:
+            entry = self.group_index.lookup(group)
+            if entry and await self.loader.get_group_schedule(entry["excel_url"], group, entry["column"]):
+                warmed += 1
+        print(f"🔥 Прогрето расписаний: {warmed} из {len(groups)}")
+
+    # 🔥 NEW: /ics — расписание группы файлом календаря
+    async def handle_ics(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        user_choice = self.user_manager.get_user_choice(update.effective_user.id)
+        if not user_choice or not user_choice.get("group"):
+            await update.message.reply_text("❌ Сначала выбери группу через /start")
+            return
+
+        group = user_choice["group"]
+        entry = self.find_group(group, user_choice["course"], user_choice.get("base", "9"))
+        if not entry:
+            await update.message.reply_text("❌ Файл расписания не найден для выбранного курса")
+            return
+
+        self.analytics.track("ics", group=group, course=user_choice["course"])
+
+        key = (entry["course_key"], entry["group"])
+        item = self.ics_cache.get(key)
+        if item is None:
+            # Фоновая сборка ещё не дошла до группы — собираем её календарь сейчас
+            result_data = await self.loader.get_group_schedule(entry["excel_url"], group, entry["column"])
+            if not result_data:
+                await update.message.reply_text(f"❌ Не удалось загрузить расписание для {group}")
+                return
+            self.ics_cache.update(key, result_data)
+            item = self.ics_cache.get(key)
+
+        if item["file_id"]:
+            # Файл уже лежит в Telegram — отправляем ссылкой, без повторной загрузки
+            await update.message.reply_document(document=item["file_id"])
+            return
+
+        message = await update.message.reply_document(document=item["data"], filename=f"{entry['group']}.ics",
+                                                      caption="📆 Импортируй файл в календарь телефона")
+        self.ics_cache.set_file_id(key, item, message.document.file_id)
+
+    # 🔥 NEW: /stats — метрики загрузки расписаний (только для админов)
+    async def handle_stats(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not self.is_admin(update.effective_user.id):
+            return
+
+        await update.message.reply_text(self.loader.report() + "\n\n" + self.analytics.report())
+
+    # 🔥 NEW: /index — отчёт по индексу групп: дубли между файлами и группы, которых нет нигде
+    async def handle_index(self, update: Update, context: ContextTypes.DEFAULT_TYPE) -> None:
+        if not self.is_admin(update.effective_user.id):
+            return
+
+        self.refresh_index()
+        user_groups = [data.get("group") for data in self.user_manager.load_all_users().values()]
+        text = self.group_index.report(user_groups)
+        if self._index_task and not self._index_task.done():
+            text += "\n\n⏳ Индекс пересобирается — это отчёт по предыдущей версии"
+        await update.message.reply_text(text)
+
+    # 🔄 MODIFIED: format_schedule теперь генератор — отдаёт сообщения не длиннее limit.
+    # Режет по границам дней, а если день не влезает целиком — между парами, повторяя заголовок дня.
+    # Заголовок расписания всегда идёт вместе с первым днём.
+    def format_schedule(self, data: dict, group: str, limit: int = TELEGRAM_MESSAGE_LIMIT) -> Iterator[str]:
         schedule = data.get("schedule", {})
         stats = data.get("stats", {})
 
         if not schedule:
-            return f"❌ Нет расписания для {group}"
+            yield f"❌ Нет расписания для {group}"
+            return
 
         days_order = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
-        result = [f"📅 Расписание для группы -{group}-:\n"]
+        title = f"📅 Расписание для группы -{group}-:\n"
+        result = [title]
 
         # Сначала разбиваем по дням
         day_blocks = {}
@@ -299,7 +714,8 @@ class ScheduleBot:
         # Формируем вывод по порядку дней
         for day in days_order:
             if day in day_blocks:
-                result.append(f" - {day}: -\n")
+                day_header = f" - {day}: -\n"
+                day_lines = []
                 for lesson_num, info in sorted(day_blocks[day]):
                     subj = info["subject"]
                     time = info["time"]
@@ -307,17 +723,108 @@ class ScheduleBot:
                     teacher = info["teacher"]
                     subgroup = f" | Подгруппа: {info['subgroup']}" if info["subgroup"] else ""
 
-                    result.append(f"{lesson_num}️. {time} — {subj} \n👨‍🏫 {teacher} | 🚪 {room}{subgroup}\n")
+                    day_lines.append(f"{lesson_num}️. {time} — {subj} \n👨‍🏫 {teacher} | 🚪 {room}{subgroup}\n")
+
+                # День не влезает в текущее сообщение, но влезет в отдельное — начинаем с него новое
+                day_text_len = message_length("\n".join([day_header] + day_lines))
+                if result != [title] and day_text_len <= limit \
+                        and message_length("\n".join(result)) + 1 + day_text_len > limit:
+                    yield "\n".join(result)
+                    result = []
+
+                # Строка длиннее сообщения режется так, чтобы вместе с заголовками дня и расписания влезть в limit
+                width = limit - message_length(title) - message_length(day_header) - 2
+                need_header = True
+                for line in day_lines:
+                    for piece in self._split_long_line(line, width):
+                        block = [day_header, piece] if need_header else [piece]
+                        if result and message_length("\n".join(result + block)) > limit:
+                            yield "\n".join(result)
+                            result = []
+                            block = [day_header, piece]
+                        result.extend(block)
+                        need_header = False
 
         # Добавим статистику
-        result.append(
+        stats_text = (
             f"📊 -Статистика: \n"
             f"Всего лент: {stats.get('total', 0)} \n"
             f"Очных лент: {stats.get('normal', 0)} \n"
             f"Дистанционных лент: {stats.get('distant', 0)}"
         )
+        if result and message_length("\n".join(result + [stats_text])) > limit:
+            yield "\n".join(result)
+            result = []
+        result.append(stats_text)
+
+        yield "\n".join(result)
 
-        return "\n".join(result)
+    @staticmethod
+    def _split_long_line(line: str, width: int) -> list:
+        """
+        Режет строку длиннее width (в единицах UTF-16) на куски — по пробелу, если он недалеко от края.
+        Символ вне BMP не разрывается пополам: граница ставится только между символами.
+        """
+        pieces = []
+        while message_length(line) > width:
+            # Сколько символов строки влезает в width единиц UTF-16
+            end = units = 0
+            for char in line:
+                units += 2 if ord(char) > 0xFFFF else 1
+                if units > width:
+                    break
+                end += 1
+
+            cut = line.rfind(" ", 0, end)
+            if cut < end // 2:
+                cut = max(end, 1)
+            pieces.append(line[:cut])
+            line = line[cut:].lstrip(" ")
+        pieces.append(line)
+        return pieces
+
+    @staticmethod
+    async def send_chunks(message, chunks: Iterable[str]) -> None:
+        """
+        Отправляет сообщения по порядку, но конвейером: пока сообщение N уходит в Telegram,
+        рендерится сообщение N+1.
+        """
+        in_flight = None
+        try:
+            for chunk in chunks:
+                if in_flight:
+                    await in_flight
+                in_flight = asyncio.create_task(message.reply_text(chunk))
+                # Даём задаче начать отправку до того, как возьмёмся за следующий кусок
+                await asyncio.sleep(0)
+        finally:
+            # Последнее сообщение, а если рендер следующего куска упал — уже начатое: отправку
+            # не бросаем без присмотра, а дожидаемся; при отмене — отменяем и её
+            if in_flight and not in_flight.done():
+                try:
+                    await in_flight
+                except asyncio.CancelledError:
+                    in_flight.cancel()
+                    raise
+
+    def find_group(self, group, course, base) -> Optional[Dict[str, Any]]:
+        """
+        Файл и колонка группы из глобального индекса.
+        Курс по базе вычисляется, чтобы выбрать файл, если группа есть в нескольких,
+        и как запасной вариант: если группы нет в индексе (например, файл не загрузился
+        при сборке), берём файл по курсу и базе, а колонку ищет разбор — как раньше.
+        None — для курса нет файла расписания.
+        """
+        excel_course_key = self._compute_excel_course(course, base)
+        self.refresh_index()
+        entry = self.group_index.lookup(group, excel_course_key)
+        if entry:
+            return entry
+
+        excel_url = EXCEL_URLS.get(excel_course_key)
+        if not excel_url:
+            return None
+        return {"group": group, "course_key": excel_course_key, "excel_url": excel_url, "column": None}
 
         # 🔥 NEW: Помощник — вычисляет, какой ключ EXCEL_URLS использовать
 
@@ -347,10 +854,18 @@ def main() -> None:
         return
 
     bot = ScheduleBot()
-    application = Application.builder().token(BOT_TOKEN).build()
+    # concurrent_updates — иначе апдейты обрабатываются строго по одному и одинаковые запросы не пересекаются
+    application = Application.builder().token(BOT_TOKEN).post_init(bot.post_init) \
+        .post_shutdown(bot.post_shutdown).concurrent_updates(True).build()
 
     # Подключаем handlers
     application.add_handler(CommandHandler("start", bot.start))
+    application.add_handler(CommandHandler("profile", bot.handle_profile))
+    application.add_handler(CommandHandler("index", bot.handle_index))
+    application.add_handler(CommandHandler("stats", bot.handle_stats))
+    application.add_handler(CommandHandler("ics", bot.handle_ics))
+    application.add_handler(MessageHandler(filters.Document.FileExtension("xlsx"), bot.handle_document))
+    application.add_handler(CallbackQueryHandler(bot.handle_upload_decision, pattern="^upload:"))
     application.add_handler(MessageHandler(filters.Text(["🧑‍🏫 9 классов", "🎓 11 классов"]), bot.handle_base_selection))
     application.add_handler(MessageHandler(filters.Text(["1 курс", "2 курс", "3 курс", "4 курс", "⬅️ Вернуться"]),
                                            bot.handle_course_selection))
@@ -363,4 +878,4 @@ def main() -> None:
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,6 +1,29 @@
 import os
 
 BOT_TOKEN = os.getenv("BOT_TOKEN")
+
+# Telegram id администраторов через запятую: ADMIN_IDS="123,456"
+ADMIN_IDS = {int(x) for x in os.getenv("ADMIN_IDS", "").replace(" ", "").split(",") if x.isdigit()}
+
+# Выборочное профилирование обработчиков: доля вызовов (0 — выключено), окно агрегации и путь для .pstats
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0") or 0)
+PROFILE_WINDOW_SECONDS = int(os.getenv("PROFILE_WINDOW_SECONDS", "3600") or 3600)
+PROFILE_DUMP_PATH = os.getenv("PROFILE_DUMP_PATH", "profile.pstats")
+
+# Аналитика использования: папка с дневными файлами и интервал сброса счётчиков (сек)
+ANALYTICS_DIR = os.getenv("ANALYTICS_DIR", "analytics")
+ANALYTICS_FLUSH_SECONDS = int(os.getenv("ANALYTICS_FLUSH_SECONDS", "300") or 300)
+
+# Сколько самых популярных групп разбирать заранее при старте и сколько расписаний держать в памяти
+PREWARM_TOP_GROUPS = int(os.getenv("PREWARM_TOP_GROUPS", "10") or 10)
+SCHEDULE_CACHE_SIZE = int(os.getenv("SCHEDULE_CACHE_SIZE", "64") or 64)
+
+# Как часто пересобирать календари, если часть файлов берётся по URL (их изменения не видны по mtime), сек
+ICS_URL_REFRESH_SECONDS = int(os.getenv("ICS_URL_REFRESH_SECONDS", "3600") or 3600)
+
+# Через сколько повторить чтение файлов, в которых индекс не нашёл групп (удваивается до часа), сек
+INDEX_RETRY_SECONDS = int(os.getenv("INDEX_RETRY_SECONDS", "60") or 60)
+
 GROUP_CODES = {
     "1 курс": ["ИС", "МД", "Э", "ЛС", "СТ", "МЭ", "ТД", "МС", "БП", "МР"],
     "2 курс": ["ИС", "МД", "Э", "ЛС", "СТ", "МЭ", "ТД", "МС", "БП", "МР"],
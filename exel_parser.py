@@ -1,27 +1,45 @@
+import hashlib
 import os
 import re
 import tempfile
+from datetime import date
 from typing import Optional, Dict, Any, List
 import requests
 from openpyxl.cell import Cell
 
 from config import LESSON_TIMES, GROUP_CODES
 
+# Сколько верхних строк листа просматривать в поисках заголовка с группами
+LAYOUT_SCAN_ROWS = 20
+LESSON_TIME_RE = re.compile(r'^\s*\d{1,2}[.:]\d{2}\s*-\s*\d{1,2}[.:]\d{2}')
+
+# Дата в ячейке дня: "Четверг  16 октября" или "Четверг 16.10.2025"
+MONTHS = {
+    "января": 1, "февраля": 2, "марта": 3, "апреля": 4, "мая": 5, "июня": 6,
+    "июля": 7, "августа": 8, "сентября": 9, "октября": 10, "ноября": 11, "декабря": 12
+}
+DAY_DATE_RE = re.compile(r'(\d{1,2})\s+([а-яё]+)', re.IGNORECASE)
+DAY_NUMERIC_DATE_RE = re.compile(r'(\d{1,2})\.(\d{1,2})(?:\.(\d{2,4}))?')
+
 
 class ExcelParser:
     def __init__(self):
         self.temp_files: List[str] = []
 
-    def get_group_schedule(self, excel_content: str, group_name: str) -> Optional[Dict[str, Any]]:
+        # Кэш разметки листов: отпечаток версии файла → описание (см. detect_layout)
+        self.layouts: Dict[tuple, Dict[str, Any]] = {}
+
+    def get_group_schedule(self, excel_content: str, group_name: str,
+                           group_col: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        """
+        group_col — колонка группы из индекса групп, если уже известна.
+        Она сверяется с ячейкой заголовка, иначе колонка ищется по разметке.
+        """
 
         from openpyxl import load_workbook
 
+        excel_path = None
         try:
-            total_lessons = 0
-            distant_lessons = 0
-            self_study_lessons = 0
-            normal_lessons = 0
-            current_day = "Понедельник"
             excel_path = self.download_excel(excel_content)
             if not excel_path:
                 return None
@@ -29,109 +47,199 @@ class ExcelParser:
             wb = load_workbook(excel_path)
             ws = wb.active
 
-            # Определяем строку с группами в зависимости от файла
-            filename = excel_content.lower()
-            if "2-3" in filename:
-                group_row = 7  # для файла 2-3 курсы
-            else:
-                group_row = 6  # для остальных файлов
-
-            print(f"🎯 Ищу группу в строке {group_row}")
-
-            # Ищем группу в правильной строке
-            group_col = None
-            for col in range(4, ws.max_column + 1):
-                cell_value = ws.cell(row=group_row, column=col).value
-                if cell_value and group_name.upper() in str(cell_value).upper():
-                    group_col = col
-                    print(f"✅ Найдена группа '{group_name}' в колонке {col}")
-                    break
+            # Разметка листа определяется один раз на версию файла
+            layout = self.get_layout(ws, self.file_fingerprint(excel_content, excel_path))
+            if not layout:
+                print("❌ Не удалось найти строку с группами!")
+                return None
 
+            if group_col:
+                header_value = ws.cell(row=layout["header_row"], column=group_col).value
+                if not header_value or str(group_name).upper().strip() not in str(header_value).upper():
+                    group_col = None
+            if not group_col:
+                group_col = self.find_group_column(layout, group_name)
             if not group_col:
                 print(f"❌ Группа '{group_name}' не найдена в файле!")
                 return None
 
-            schedule = {}
-
-            # Парсим начиная со следующей строки после заголовка
-            start_row = group_row + 1
-            print(f"🎯 Начинаю парсинг с строки {start_row}")
-
-            for row in range(start_row, ws.max_row + 1):
-                day_cell = ws.cell(row=row, column=1)  # ячейка дня
-                time_cell = ws.cell(row=row, column=2)  # ячейка времени
-                lesson_num_cell = ws.cell(row=row, column=3)  # ячейка номера пары
-                lesson_cell = ws.cell(row=row, column=group_col)  # ячейка предмета
-
-                # Обновляем текущий день
-                if day_cell.value and str(day_cell.value).strip():
-                    current_day = str(day_cell.value).strip().split()[0]
-
-                if not lesson_num_cell.value:
-                    continue
-
-                try:
-                    lesson_num = int(lesson_num_cell.value)
-                except (ValueError, TypeError):
-                    continue
-
-                if not lesson_cell.value or not str(lesson_cell.value).strip():
-                    continue
-
-                color_type = self.get_cell_color_type(lesson_cell)
-
-                total_lessons += 1
-                if color_type == "distant":
-                    distant_lessons += 1
-                elif color_type == "self_study":
-                    self_study_lessons += 1
-                else:
-                    normal_lessons += 1
-
-                lesson_text = str(lesson_cell.value).strip()
-                parsed = self.parse_lesson_text(lesson_text)
-
-                lesson_time = self.get_lesson_time(lesson_num)
-
-                if color_type == "distant":
-                    subject_text = f"💻 {parsed['subject']} (дистант)"
-                elif color_type == "self_study":
-                    subject_text = f"📚 {parsed['subject']} (самостоятельная)"
-                else:
-                    subject_text = parsed['subject']
-
-                schedule[lesson_num] = {
-                    "day": current_day,
-                    "time": lesson_time,
-                    "subject": subject_text,
-                    "teacher": parsed["teacher"],
-                    "room": parsed["room"],
-                    "color_type": color_type,
-                    "subgroup": parsed.get("subgroup", "")
-                }
+            print(f"✅ Найдена группа '{group_name}' в колонке {group_col}")
 
+            result = self.parse_group_sheet(ws, layout, group_col)
             wb.close()
 
-            stats_data = {
-                "total": total_lessons,
-                "distant": distant_lessons,
-                "self_study": self_study_lessons,
-                "normal": normal_lessons
-            }
+            print(f"📊 Расписание собрано: {len(result['schedule'])} пар")
+            return result
 
-            print(f"📊 Расписание собрано: {len(schedule)} пар")
+        except Exception as e:
+            print(f"❌ Ошибка парсинга расписания: {e}")
+            return None
+        finally:
+            # Удаляем только свою копию — параллельные разборы в других потоках работают со своими
+            if excel_path:
+                self.cleanup_temp_files([excel_path])
 
-            return {
-                "schedule": schedule,
-                "stats": stats_data
-            }
+    def get_all_group_schedules(self, excel_content: str) -> Optional[Dict[str, Dict[str, Any]]]:
+        """
+        Расписания всех групп файла за одну загрузку книги: {группа: {"schedule", "stats"}}.
+        None — файл не открылся или в нём не нашлась строка с группами.
+        """
+        from openpyxl import load_workbook
+
+        excel_path = None
+        try:
+            excel_path = self.download_excel(excel_content)
+            if not excel_path:
+                return None
+
+            wb = load_workbook(excel_path)
+            ws = wb.active
+
+            layout = self.get_layout(ws, self.file_fingerprint(excel_content, excel_path))
+            if not layout:
+                print("❌ Не удалось найти строку с группами!")
+                return None
+
+            schedules = {group: self.parse_group_sheet(ws, layout, first_col)
+                         for group, (first_col, _) in layout["groups"].items()}
+            wb.close()
+
+            print(f"📊 Разобрано групп: {len(schedules)}")
+            return schedules
 
         except Exception as e:
             print(f"❌ Ошибка парсинга расписания: {e}")
             return None
         finally:
-            if isinstance(excel_content, str) and excel_content.startswith('http'):
-                self.cleanup_temp_files()
+            # Удаляем только свою копию — параллельные разборы в других потоках работают со своими
+            if excel_path:
+                self.cleanup_temp_files([excel_path])
+
+    def parse_group_sheet(self, ws, layout: Dict[str, Any], group_col: int) -> Dict[str, Any]:
+        """Разбирает колонку группы на уже открытом листе по найденной разметке"""
+        total_lessons = 0
+        distant_lessons = 0
+        self_study_lessons = 0
+        normal_lessons = 0
+        current_day = "Понедельник"
+        current_date = None
+
+        schedule = {}
+
+        # Все пары недели по порядку: в schedule ключ — только номер пары, и одинаковые номера
+        # разных дней перетирают друг друга
+        lessons = []
+
+        # Парсим начиная со следующей строки после заголовка
+        start_row = layout["first_row"]
+        day_col = layout["day_col"]
+        time_col = layout["time_col"]
+        pair_col = layout["pair_col"]
+
+        for row in range(start_row, ws.max_row + 1):
+            day_cell = ws.cell(row=row, column=day_col)  # ячейка дня
+            time_cell = ws.cell(row=row, column=time_col)  # ячейка времени
+            lesson_num_cell = ws.cell(row=row, column=pair_col)  # ячейка номера пары
+            lesson_cell = ws.cell(row=row, column=group_col)  # ячейка предмета
+
+            # Обновляем текущий день; дата из той же ячейки нужна календарю
+            if day_cell.value and str(day_cell.value).strip():
+                current_day = str(day_cell.value).strip().split()[0]
+                current_date = self.parse_day_date(day_cell.value)
+
+            if not lesson_num_cell.value:
+                continue
+
+            try:
+                lesson_num = int(lesson_num_cell.value)
+            except (ValueError, TypeError):
+                continue
+
+            if not lesson_cell.value or not str(lesson_cell.value).strip():
+                continue
+
+            color_type = self.get_cell_color_type(lesson_cell)
+
+            total_lessons += 1
+            if color_type == "distant":
+                distant_lessons += 1
+            elif color_type == "self_study":
+                self_study_lessons += 1
+            else:
+                normal_lessons += 1
+
+            lesson_text = str(lesson_cell.value).strip()
+            parsed = self.parse_lesson_text(lesson_text)
+
+            lesson_time = self.get_lesson_time(lesson_num)
+
+            if color_type == "distant":
+                subject_text = f"💻 {parsed['subject']} (дистант)"
+            elif color_type == "self_study":
+                subject_text = f"📚 {parsed['subject']} (самостоятельная)"
+            else:
+                subject_text = parsed['subject']
+
+            schedule[lesson_num] = {
+                "day": current_day,
+                "time": lesson_time,
+                "subject": subject_text,
+                "teacher": parsed["teacher"],
+                "room": parsed["room"],
+                "color_type": color_type,
+                "subgroup": parsed.get("subgroup", "")
+            }
+            lessons.append(dict(schedule[lesson_num], num=lesson_num,
+                                date=current_date.isoformat() if current_date else None))
+
+        stats_data = {
+            "total": total_lessons,
+            "distant": distant_lessons,
+            "self_study": self_study_lessons,
+            "normal": normal_lessons
+        }
+
+        return {
+            "schedule": schedule,
+            "lessons": lessons,
+            "stats": stats_data
+        }
+
+    @staticmethod
+    def parse_day_date(value, today: Optional[date] = None) -> Optional[date]:
+        """
+        Дата из ячейки дня ("Четверг  16 октября"). Год в расписании обычно не пишут —
+        берём тот, при котором дата ближе всего к сегодняшней (файл на следующую неделю в конце декабря — это январь).
+        None — в ячейке только день недели.
+        """
+        if hasattr(value, "date") and not isinstance(value, str):
+            return value.date()
+
+        text = str(value).strip()
+        year = None
+        match = DAY_DATE_RE.search(text)
+        if match and match.group(2).lower() in MONTHS:
+            day, month = int(match.group(1)), MONTHS[match.group(2).lower()]
+        else:
+            match = DAY_NUMERIC_DATE_RE.search(text)
+            if not match:
+                return None
+            day, month = int(match.group(1)), int(match.group(2))
+            if match.group(3):
+                year = int(match.group(3))
+                year += 2000 if year < 100 else 0
+
+        today = today or date.today()
+        years = [year] if year else [today.year - 1, today.year, today.year + 1]
+        candidates = []
+        for candidate_year in years:
+            try:
+                candidates.append(date(candidate_year, month, day))
+            except ValueError:
+                continue
+        if not candidates:
+            return None
+        return min(candidates, key=lambda candidate: abs((candidate - today).days))
 
     def download_excel(self, url: str) -> Optional[str]:
         try:
@@ -158,14 +266,16 @@ class ExcelParser:
             print(f"❌ Ошибка загрузки: {e}")
             return None
 
-    def cleanup_temp_files(self) -> None:
-        for temp_file in self.temp_files:
+    def cleanup_temp_files(self, paths: Optional[List[str]] = None) -> None:
+        """Удаляет временные копии: указанные или все"""
+        for temp_file in list(self.temp_files if paths is None else paths):
             try:
                 if os.path.exists(temp_file):
                     os.unlink(temp_file)
             except Exception as e:
                 print(f"⚠️ Не удалось удалить временный файл: {e}")
-        self.temp_files.clear()
+            if temp_file in self.temp_files:
+                self.temp_files.remove(temp_file)
 
     @staticmethod
     def get_cell_color_type(cell: Cell) -> str:
@@ -213,45 +323,153 @@ class ExcelParser:
 
     def find_groups_in_excel(self, excel_content, course_name):
         """
-        Ищет названия групп в Excel в зависимости от файла:
-        - 1 курсы / 1-2 курсы / 3-4 курсы → строка 6 (индекс 5)
-        - 2-3 курсы → строка 7 (индекс 6)
+        Возвращает названия групп из Excel в порядке колонок.
+        Строка заголовка ищется автоматически (см. detect_layout).
         """
+        layout = self.get_file_layout(excel_content)
+        return list(layout["groups"]) if layout else []
 
-        try:
-            import pandas as pd
-            from io import BytesIO
-            import requests
-
-            # Загружаем файл: URL или локальный путь
-            if isinstance(excel_content, str) and excel_content.lower().startswith("http"):
-                file_data = BytesIO(requests.get(excel_content).content)
-                df = pd.read_excel(file_data, header=None)
-            else:
-                df = pd.read_excel(excel_content, header=None)
-
-            # Определяем строку с группами
-            file = str(excel_content).lower()
-            if "2-3" in file:
-                row_index = 6  # 7 строка
-            else:
-                row_index = 5  # 6 строка
+    def get_file_layout(self, excel_content: str) -> Optional[Dict[str, Any]]:
+        """
+        Разметка файла расписания. Для той же версии локального файла
+        берётся из кэша без открытия книги.
+        """
+        from openpyxl import load_workbook
 
-            group_row = df.iloc[row_index]
-            groups = []
+        excel_path = None
+        try:
+            if not excel_content.lower().startswith("http") and os.path.exists(excel_content):
+                cached = self.layouts.get(self.file_fingerprint(excel_content, excel_content))
+                if cached:
+                    return cached
 
-            for value in group_row[2:]:  # начиная с колонки C
-                if isinstance(value, str) and value.strip():
-                    groups.append(value.strip())
+            excel_path = self.download_excel(excel_content)
+            if not excel_path:
+                return None
 
-                    # Убираем лишние значения типа "№" или None
-                    groups = [g for g in groups if isinstance(g, str) and len(g) > 2 and g[0].isalnum()]
+            wb = load_workbook(excel_path, read_only=True)
+            layout = self.get_layout(wb.active, self.file_fingerprint(excel_content, excel_path))
+            wb.close()
 
-            return groups
+            return layout
 
         except Exception as e:
             print(f"Ошибка при поиске групп: {e}")
-            return []
+            return None
+        finally:
+            if excel_path:
+                self.cleanup_temp_files([excel_path])
+
+    @staticmethod
+    def file_fingerprint(source: str, local_path: str) -> tuple:
+        """
+        Отпечаток версии файла расписания.
+        Локальный файл — путь + время изменения + размер, скачанный по URL — хэш содержимого.
+        Смотрим local_path — ту копию, которую действительно разбираем: copy2 сохраняет время
+        изменения и размер, а файл по исходному пути могли уже подменить после копирования.
+        """
+        if isinstance(source, str) and source.startswith('http'):
+            with open(local_path, 'rb') as f:
+                return source, hashlib.sha1(f.read()).hexdigest()
+
+        stat = os.stat(local_path)
+        return source, stat.st_mtime_ns, stat.st_size
+
+    def invalidate(self, excel_content: str) -> None:
+        """Забывает кэшированную разметку файла (после замены расписания)"""
+        # list() — снимок ключей: кэш могут пополнять разборы в других потоках
+        for key in [k for k in list(self.layouts) if k[0] == excel_content]:
+            self.layouts.pop(key, None)
+
+    def get_layout(self, ws, fingerprint: tuple) -> Optional[Dict[str, Any]]:
+        """Разметка листа из кэша, при промахе — определяет и запоминает"""
+        layout = self.layouts.get(fingerprint)
+        if layout is None:
+            layout = self.detect_layout(ws)
+            if layout:
+                # Старые версии того же файла больше не нужны. Для локального файла сравниваем
+                # время изменения: запоздавший разбор старой копии не должен вытеснить новую
+                for key in [k for k in list(self.layouts) if k[0] == fingerprint[0]]:
+                    if len(key) < 3 or len(fingerprint) < 3 or key[1] <= fingerprint[1]:
+                        self.layouts.pop(key, None)
+                self.layouts[fingerprint] = layout
+                print(f"🧭 Разметка: строка групп {layout['header_row']}, групп {len(layout['groups'])}")
+        return layout
+
+    @classmethod
+    def detect_layout(cls, ws) -> Optional[Dict[str, Any]]:
+        """
+        Определяет разметку листа:
+        - header_row — строка, где больше всего названий групп (is_valid_group_name)
+        - day_col / time_col / pair_col — колонки дня, времени и номера пары
+        - groups — {название группы: (первая колонка, последняя колонка)}
+        """
+        rows = list(ws.iter_rows(min_row=1, max_row=LAYOUT_SCAN_ROWS, values_only=True))
+
+        header_index, header_groups = None, {}
+        for index, values in enumerate(rows):
+            groups = {col: str(value).strip() for col, value in enumerate(values, start=1)
+                      if value is not None and cls.is_valid_group_name(value)}
+            if len(groups) > len(header_groups):
+                header_index, header_groups = index, groups
+
+        if header_index is None:
+            return None
+
+        header_row = header_index + 1
+        group_cols = sorted(header_groups)
+        first_group_col = group_cols[0]
+        max_col = max(len(values) for values in rows)
+
+        # Номер пары — колонка с "№" в заголовке, иначе ближайшая слева от групп
+        pair_col = None
+        for col, value in enumerate(rows[header_index][:first_group_col - 1], start=1):
+            if value is not None and str(value).strip() == "№":
+                pair_col = col
+        if pair_col is None:
+            pair_col = max(first_group_col - 1, 1)
+
+        # Время — колонка левее пары, где в первых строках данных стоит "8.00-9.30"
+        time_col = None
+        for values in rows[header_index + 1:]:
+            for col, value in enumerate(values[:pair_col - 1], start=1):
+                if value is not None and LESSON_TIME_RE.match(str(value)):
+                    time_col = col
+                    break
+            if time_col:
+                break
+        if time_col is None:
+            time_col = max(pair_col - 1, 1)
+
+        # День — первая колонка листа, если она не занята временем
+        day_col = 1 if time_col > 1 else time_col
+
+        groups = {}
+        for i, col in enumerate(group_cols):
+            last_col = group_cols[i + 1] - 1 if i + 1 < len(group_cols) else max_col
+            groups.setdefault(header_groups[col], (col, last_col))
+
+        return {
+            "header_row": header_row,
+            "first_row": header_row + 1,
+            "day_col": day_col,
+            "time_col": time_col,
+            "pair_col": pair_col,
+            "groups": groups
+        }
+
+    @staticmethod
+    def find_group_column(layout: Dict[str, Any], group_name: str) -> Optional[int]:
+        """Колонка группы: точное совпадение названия, иначе вхождение (как раньше при переборе ячеек)"""
+        name = str(group_name).upper().strip()
+        substring_match = None
+        for group, (first_col, _) in layout["groups"].items():
+            group_upper = group.upper()
+            if group_upper == name:
+                return first_col
+            if substring_match is None and name in group_upper:
+                substring_match = first_col
+        return substring_match
 
     @staticmethod
     def parse_lesson_text(lesson_text: str) -> Dict[str, str]:
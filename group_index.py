@@ -0,0 +1,152 @@
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from config import EXCEL_URLS, INDEX_RETRY_SECONDS
+
+# Предел паузы между повторами чтения файлов без групп, сек
+MAX_RETRY_SECONDS = 3600
+
+
+class GroupIndex:
+    """
+    Глобальный индекс «группа → файл расписания и колонка» по всем файлам EXCEL_URLS.
+    Строится один раз на снимок (набор версий файлов) и пересобирается, когда какой-то файл меняется.
+    Если какой-то файл не прочитался, снимок считается устаревшим через retry_seconds —
+    пауза удваивается с каждой неудачей, пока файл не прочитается.
+    """
+
+    def __init__(self, parser, retry_seconds: int = INDEX_RETRY_SECONDS):
+        self.parser = parser
+        self.retry_seconds = retry_seconds
+
+        # Версии файлов, по которым построен индекс
+        self.snapshot: Optional[tuple] = None
+
+        # Нормализованное имя группы → [{"group", "course_key", "excel_url", "column"}, ...]
+        self.groups: Dict[str, List[Dict[str, Any]]] = {}
+
+        # Ключи EXCEL_URLS, в которых не нашлось ни одной группы
+        self.empty_files: List[str] = []
+
+        # Когда снова попробовать прочитать empty_files и текущая пауза между попытками
+        self._retry_at = 0.0
+        self._retry_delay = retry_seconds
+
+        # Сборка может идти в потоке (после загрузки файла админом); остальные её не ждут
+        self._build_lock = threading.Lock()
+
+    @staticmethod
+    def normalize(group_name: str) -> str:
+        return "".join(str(group_name).upper().split())
+
+    def current_snapshot(self) -> tuple:
+        """Версии всех файлов. Для URL версию без скачивания не узнать — учитывается только адрес"""
+        versions = []
+        for course_key, excel_url in EXCEL_URLS.items():
+            if not excel_url.startswith('http') and os.path.exists(excel_url):
+                versions.append((course_key,) + self.parser.file_fingerprint(excel_url, excel_url))
+            else:
+                versions.append((course_key, excel_url))
+        return tuple(versions)
+
+    def is_stale(self, snapshot: Optional[tuple] = None) -> bool:
+        """Нужна ли пересборка: файлы изменились или пора повторить чтение файлов без групп"""
+        if snapshot is None:
+            snapshot = self.current_snapshot()
+        if snapshot != self.snapshot:
+            return True
+        return bool(self.empty_files) and time.time() >= self._retry_at
+
+    def refresh(self) -> bool:
+        """
+        Пересобирает индекс, если он устарел (is_stale). Возвращает True, если индекс построен заново.
+        Если сборка уже идёт в другом потоке — сразу возвращает False, пока отвечает старый индекс.
+        """
+        snapshot = self.current_snapshot()
+        if not self.is_stale(snapshot):
+            return False
+
+        if not self._build_lock.acquire(blocking=False):
+            return False
+        try:
+            return self._build(snapshot)
+        finally:
+            self._build_lock.release()
+
+    def _build(self, snapshot: tuple) -> bool:
+        groups = {}
+        empty_files = []
+        for course_key, excel_url in EXCEL_URLS.items():
+            layout = self.parser.get_file_layout(excel_url)
+            if not layout or not layout["groups"]:
+                empty_files.append(course_key)
+                continue
+
+            for group, (column, _) in layout["groups"].items():
+                groups.setdefault(self.normalize(group), []).append({
+                    "group": group,
+                    "course_key": course_key,
+                    "excel_url": excel_url,
+                    "column": column
+                })
+
+        if empty_files:
+            self._retry_at = time.time() + self._retry_delay
+            self._retry_delay = min(self._retry_delay * 2, MAX_RETRY_SECONDS)
+        else:
+            self._retry_delay = self.retry_seconds
+
+        self.groups = groups
+        self.empty_files = empty_files
+        self.snapshot = snapshot
+
+        print(f"🗂 Индекс групп: {len(groups)} групп в {len(EXCEL_URLS) - len(empty_files)} файлах")
+        for group, entries in self.duplicates().items():
+            print(f"⚠️ Группа {group} есть в нескольких файлах: {', '.join(e['course_key'] for e in entries)}")
+        for course_key in empty_files:
+            print(f"⚠️ В файле {course_key} не найдено ни одной группы")
+        return True
+
+    def invalidate(self) -> None:
+        self.snapshot = None
+
+    def lookup(self, group_name: str, preferred_course: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """
+        Где лежит группа. Если она есть в нескольких файлах — берётся preferred_course
+        (курс, вычисленный по выбору пользователя), иначе первый по порядку EXCEL_URLS.
+        """
+        entries = self.groups.get(self.normalize(group_name))
+        if not entries:
+            return None
+
+        for entry in entries:
+            if entry["course_key"] == preferred_course:
+                return entry
+        return entries[0]
+
+    def duplicates(self) -> Dict[str, List[Dict[str, Any]]]:
+        return {entries[0]["group"]: entries for entries in self.groups.values() if len(entries) > 1}
+
+    def missing(self, group_names) -> List[str]:
+        """Группы из списка, которых нет ни в одном файле"""
+        return sorted({str(g) for g in group_names if g and self.normalize(g) not in self.groups})
+
+    def report(self, user_groups=()) -> str:
+        lines = [f"🗂 Индекс групп: {len(self.groups)} групп"]
+
+        duplicates = self.duplicates()
+        if duplicates:
+            lines.append("\n⚠️ Есть в нескольких файлах:")
+            for group, entries in duplicates.items():
+                lines.append(f"{group}: {', '.join(e['course_key'] for e in entries)}")
+
+        if self.empty_files:
+            lines.append(f"\n⚠️ Файлы без групп: {', '.join(self.empty_files)}")
+
+        missing = self.missing(user_groups)
+        if missing:
+            lines.append(f"\n❌ Группы пользователей, которых нет ни в одном файле: {', '.join(missing)}")
+
+        return "\n".join(lines)
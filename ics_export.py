@@ -0,0 +1,192 @@
+import hashlib
+import json
+import re
+from datetime import date, datetime, timedelta, timezone
+from typing import Optional, Dict, Any, List
+
+from config import LESSON_TIMES
+
+DAYS_ORDER = ["Понедельник", "Вторник", "Среда", "Четверг", "Пятница", "Суббота"]
+
+# Сколько недель повторяется пара без даты: шаблон недели не должен жить в календаре вечно
+TEMPLATE_WEEKS = 4
+
+
+def _lessons(result: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """
+    Пары недели с днём, номером и датой (если она была в ячейке дня). Берём полный список lessons;
+    в schedule ключ — только номер пары, и там остаётся по одной паре на номер за всю неделю.
+    """
+    if "lessons" in result:
+        return result["lessons"]
+    return [dict(info, num=lesson_num) for lesson_num, info in result.get("schedule", {}).items()]
+
+
+def schedule_digest(result: Dict[str, Any]) -> str:
+    """Хэш расписания группы — по нему понимаем, что .ics и file_id устарели"""
+    payload = json.dumps(_lessons(result), ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()
+
+
+def _escape(text: str) -> str:
+    text = str(text).replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+    return text.replace("\r\n", "\\n").replace("\n", "\\n")
+
+
+def _fold(line: str) -> str:
+    """RFC 5545: строки длиннее 75 байт переносятся с пробелом в начале продолжения"""
+    raw = line.encode("utf-8")
+    if len(raw) <= 75:
+        return line
+
+    parts = []
+    current = ""
+    limit = 75
+    for char in line:
+        if len((current + char).encode("utf-8")) > limit:
+            parts.append(current)
+            current = ""
+            limit = 74  # у продолжения первый байт — пробел
+        current += char
+    parts.append(current)
+    return "\r\n ".join(parts)
+
+
+def _lesson_bounds(lesson_num: int) -> Optional[tuple]:
+    """(часы, минуты) начала и конца пары из LESSON_TIMES"""
+    match = re.match(r'(\d{1,2})[.:](\d{2})-(\d{1,2})[.:](\d{2})', LESSON_TIMES.get(lesson_num, ""))
+    if not match:
+        return None
+    h1, m1, h2, m2 = map(int, match.groups())
+    return (h1, m1), (h2, m2)
+
+
+def current_week_start() -> date:
+    today = date.today()
+    return today - timedelta(days=today.weekday())
+
+
+def has_undated_lessons(result: Dict[str, Any]) -> bool:
+    """Есть пары без даты — их календарь привязан к неделе сборки"""
+    return any(not info.get("date") for info in _lessons(result))
+
+
+def _uid(group: str, when: str, lesson_num, subgroup: str) -> str:
+    """UID события только из того, что определяет пару: группа, дата (или день), номер, подгруппа"""
+    parts = [group, when, str(lesson_num)] + ([subgroup] if subgroup else [])
+    return _escape("-".join("_".join(str(part).split()) for part in parts)) + "@kptlist"
+
+
+def build_ics(group: str, result: Dict[str, Any], week_start: Optional[date] = None) -> bytes:
+    """
+    Календарь группы. Пара с датой (из ячейки дня) — разовое событие в этот день;
+    пара без даты — еженедельное событие с текущей недели, ограниченное TEMPLATE_WEEKS неделями.
+    Время берётся из LESSON_TIMES, без часового пояса (телефон покажет в местном времени).
+    """
+    if week_start is None:
+        week_start = current_week_start()
+    until = week_start + timedelta(weeks=TEMPLATE_WEEKS)
+
+    stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+    lines = [
+        "BEGIN:VCALENDAR",
+        "VERSION:2.0",
+        "PRODID:-//kptlist//Schedule bot//RU",
+        "CALSCALE:GREGORIAN",
+        f"X-WR-CALNAME:{_escape('Расписание ' + group)}",
+    ]
+
+    for info in _lessons(result):
+        lesson_num = info["num"]
+        bounds = _lesson_bounds(int(lesson_num))
+        if not bounds:
+            continue
+
+        if info.get("date"):
+            day = date.fromisoformat(info["date"])
+            when = info["date"]
+        elif info["day"] in DAYS_ORDER:
+            day = week_start + timedelta(days=DAYS_ORDER.index(info["day"]))
+            when = info["day"]
+        else:
+            continue
+
+        (h1, m1), (h2, m2) = bounds
+        start = datetime(day.year, day.month, day.day, h1, m1)
+        end = datetime(day.year, day.month, day.day, h2, m2)
+
+        description = f"Преподаватель: {info['teacher']}" if info.get("teacher") else ""
+        if info.get("subgroup"):
+            description += f"\nПодгруппа: {info['subgroup']}"
+
+        lines += [
+            "BEGIN:VEVENT",
+            f"UID:{_uid(group, when, lesson_num, info.get('subgroup'))}",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{start.strftime('%Y%m%dT%H%M%S')}",
+            f"DTEND:{end.strftime('%Y%m%dT%H%M%S')}",
+        ]
+        if not info.get("date"):
+            # DTSTART без часового пояса — UNTIL тоже в местном времени
+            lines.append(f"RRULE:FREQ=WEEKLY;UNTIL={until.strftime('%Y%m%d')}T000000")
+        lines.append(f"SUMMARY:{_escape(info['subject'])}")
+        if info.get("room"):
+            lines.append(f"LOCATION:{_escape('Ауд. ' + info['room'])}")
+        if description:
+            lines.append(f"DESCRIPTION:{_escape(description.strip())}")
+        lines.append("END:VEVENT")
+
+    lines.append("END:VCALENDAR")
+    return ("\r\n".join(_fold(line) for line in lines) + "\r\n").encode("utf-8")
+
+
+class IcsCache:
+    """
+    Готовые .ics по группам и file_id, который Telegram вернул после первой отправки.
+    Ключ — (ключ EXCEL_URLS, группа). При изменении расписания группы пересобирается
+    файл и забывается file_id. Календарь с парами без даты привязан к неделе сборки —
+    с началом новой недели get() собирает его заново.
+    """
+
+    def __init__(self):
+        self.items: Dict[tuple, Dict[str, Any]] = {}
+
+    def get(self, key: tuple) -> Optional[Dict[str, Any]]:
+        item = self.items.get(key)
+        if item and item["week"] and item["week"] != current_week_start():
+            item = self._build(key, item["result"], item["digest"])
+        return item
+
+    def _build(self, key: tuple, result: Dict[str, Any], digest: str) -> Dict[str, Any]:
+        # Новый словарь, а не правка старого: set_file_id по нему понимает, что файл успели пересобрать
+        week = current_week_start() if has_undated_lessons(result) else None
+        item = {
+            "digest": digest,
+            "result": result,
+            "week": week,
+            "data": build_ics(key[1], result, week),
+            "file_id": None
+        }
+        self.items[key] = item
+        return item
+
+    def update(self, key: tuple, result: Dict[str, Any]) -> bool:
+        """Кладёт расписание группы. True — .ics пересобран (новая группа или расписание изменилось)"""
+        digest = schedule_digest(result)
+        item = self.items.get(key)
+        if item and item["digest"] == digest:
+            return False
+
+        self._build(key, result, digest)
+        return True
+
+    def update_all(self, schedules: Dict[tuple, Dict[str, Any]]) -> int:
+        """Синхронизирует кэш со снимком расписаний; пропавшие группы удаляются. Возвращает число пересобранных"""
+        for key in [k for k in self.items if k not in schedules]:
+            del self.items[key]
+        return sum(self.update(key, result) for key, result in schedules.items())
+
+    def set_file_id(self, key: tuple, item: Dict[str, Any], file_id: str) -> None:
+        """Запоминает file_id, только если за время отправки отправленный файл не пересобрали"""
+        if self.items.get(key) is item:
+            item["file_id"] = file_id
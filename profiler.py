@@ -0,0 +1,153 @@
+import asyncio
+import cProfile
+import functools
+import os
+import pstats
+import random
+import threading
+import time
+from typing import Optional, List, Callable
+
+
+class SamplingProfiler:
+    """
+    Выборочный профайлер тяжёлой синхронной работы (разбор Excel и т.п.).
+    Оборачивает долю вызовов (sample_rate) в cProfile и копит статистику за окно window_seconds.
+    При sample_rate == 0 обёртка сразу вызывает функцию — профайлер не включается вообще.
+
+    Корутины не профилируются: cProfile следит за всем потоком, и во время await
+    в замер попадали бы event loop и обработчики других пользователей.
+    Обёрнутые функции выполняются в потоках (asyncio.to_thread), поэтому состояние под замком.
+    """
+
+    def __init__(self, sample_rate: float = 0.0, window_seconds: int = 3600):
+        self.sample_rate = 0.0
+        self.set_sample_rate(sample_rate)
+        self.window_seconds = window_seconds
+
+        self._stats: Optional[pstats.Stats] = None
+        self._samples = 0
+        self._window_started = time.time()
+
+        # cProfile нельзя вкладывать — одновременно профилируем не больше одного вызова
+        self._busy = False
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    def set_sample_rate(self, sample_rate: float) -> None:
+        self.sample_rate = min(max(float(sample_rate), 0.0), 1.0)
+
+    def wrap(self, func: Callable) -> Callable:
+        """Оборачивает синхронную функцию в выборочное профилирование"""
+        if asyncio.iscoroutinefunction(func):
+            raise TypeError("SamplingProfiler профилирует только синхронные функции")
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            profile = self._start_sample()
+            if profile is None:
+                return func(*args, **kwargs)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                self._finish_sample(profile)
+
+        return wrapper
+
+    def _start_sample(self) -> Optional[cProfile.Profile]:
+        # Проверка без замка — при выключенном профайлере это единственная цена вызова
+        if not self.sample_rate or random.random() >= self.sample_rate:
+            return None
+
+        with self._lock:
+            if self._busy:
+                return None
+            self._busy = True
+
+        try:
+            profile = cProfile.Profile()
+            profile.enable()
+        except Exception as e:
+            print(f"⚠️ Профайлер не запустился: {e}")
+            with self._lock:
+                self._busy = False
+            return None
+        return profile
+
+    def _finish_sample(self, profile: cProfile.Profile) -> None:
+        profile.disable()
+
+        with self._lock:
+            self._busy = False
+            try:
+                self._expire_window()
+
+                if self._stats is None:
+                    self._stats = pstats.Stats(profile)
+                else:
+                    self._stats.add(profile)
+                self._samples += 1
+            except Exception as e:
+                # Ошибка профайлера не должна ронять сам разбор
+                print(f"⚠️ Не удалось сохранить замер профайлера: {e}")
+
+    def reset(self) -> None:
+        with self._lock:
+            self._reset()
+
+    def _reset(self) -> None:
+        self._stats = None
+        self._samples = 0
+        self._window_started = time.time()
+
+    def _expire_window(self) -> None:
+        """Окно истекло — начинаем копить заново (вызывается под замком)"""
+        if time.time() - self._window_started > self.window_seconds:
+            self._reset()
+
+    def top(self, limit: int = 15) -> List[tuple]:
+        """
+        Возвращает самые тяжёлые функции по накопленному (cumulative) времени:
+        [(cumtime, ncalls, "func (file:line)"), ...]
+        """
+        with self._lock:
+            self._expire_window()
+            if self._stats is None:
+                return []
+
+            rows = []
+            for (filename, line, func_name), (_, ncalls, _, cumtime, _) in self._stats.stats.items():
+                rows.append((cumtime, ncalls, f"{func_name} ({os.path.basename(filename)}:{line})"))
+
+        rows.sort(key=lambda row: row[0], reverse=True)
+        return rows[:limit]
+
+    def report(self, limit: int = 15) -> str:
+        state = f"включён, доля {self.sample_rate:.0%}" if self.enabled else "выключен"
+        with self._lock:
+            self._expire_window()
+            minutes = int((time.time() - self._window_started) // 60)
+            samples = self._samples
+        lines = [f"🔬 Профайлер: {state}", f"Замеров за окно: {samples} (окно открыто {minutes} мин.)"]
+
+        rows = self.top(limit)
+        if not rows:
+            lines.append("Данных пока нет")
+            return "\n".join(lines)
+
+        lines.append("")
+        for cumtime, ncalls, name in rows:
+            lines.append(f"{cumtime:.3f}s  ×{ncalls}  {name}")
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> bool:
+        """Сохраняет накопленную статистику в .pstats (открывается через pstats / snakeviz)"""
+        with self._lock:
+            self._expire_window()
+            if self._stats is None:
+                return False
+            self._stats.dump_stats(path)
+        return True
@@ -0,0 +1,76 @@
+import asyncio
+import os
+from collections import OrderedDict
+from typing import Optional, Dict, Any, Callable
+
+from exel_parser import ExcelParser
+
+
+class ScheduleLoader:
+    """
+    Single-flight перед ExcelParser: одновременные запросы одной группы из одной версии файла
+    ждут один общий разбор, а не запускают каждый свой download_excel + load_workbook.
+    Разбор идёт в потоке, чтобы не блокировать обработку остальных сообщений.
+    Готовые результаты для локальных файлов держатся в LRU-кэше на cache_size групп:
+    версия файла входит в ключ, так что после замены файла старые записи просто не находятся.
+    """
+
+    def __init__(self, load: Callable[..., Optional[Dict[str, Any]]], cache_size: int = 64):
+        # Синхронная функция разбора (excel_url, group, group_col) → результат, обычно ExcelParser.get_group_schedule
+        self.load = load
+
+        # (версия файла, группа) → задача разбора, которую ждут все пришедшие за ней запросы
+        self._in_flight: Dict[tuple, asyncio.Task] = {}
+
+        # (версия файла, группа) → готовое расписание
+        self.cache_size = cache_size
+        self._results: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+
+        # Метрики: всего запросов, сколько отдано из кэша и сколько присоединились к уже идущему разбору
+        self.requests = 0
+        self.hits = 0
+        self.coalesced = 0
+
+    @staticmethod
+    def file_version(excel_url: str) -> tuple:
+        if not excel_url.startswith('http') and os.path.exists(excel_url):
+            return ExcelParser.file_fingerprint(excel_url, excel_url)
+        return (excel_url,)
+
+    async def get_group_schedule(self, excel_url: str, group: str,
+                                 group_col: Optional[int] = None) -> Optional[Dict[str, Any]]:
+        key = (self.file_version(excel_url), str(group).upper().strip())
+        self.requests += 1
+
+        if key in self._results:
+            self.hits += 1
+            self._results.move_to_end(key)
+            return self._results[key]
+
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(asyncio.to_thread(self.load, excel_url, group, group_col))
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+
+        # shield — если один из ждущих отменён, разбор для остальных продолжается
+        return await asyncio.shield(task)
+
+    def _finish(self, key: tuple, task: asyncio.Task) -> None:
+        self._in_flight.pop(key, None)
+        if task.cancelled() or task.exception() is not None:
+            return
+
+        result = task.result()
+        # Для URL версию файла не узнать — такие результаты не кэшируем, чтобы не отдавать устаревшее
+        if result and len(key[0]) > 1 and self.cache_size > 0:
+            self._results[key] = result
+            while len(self._results) > self.cache_size:
+                self._results.popitem(last=False)
+
+    def report(self) -> str:
+        share = self.coalesced / self.requests if self.requests else 0
+        return (f"⚡ Загрузка расписаний: запросов {self.requests}, из кэша {self.hits}, "
+                f"склеено с идущим разбором {self.coalesced} ({share:.0%}), сейчас в работе {len(self._in_flight)}")
@@ -31,5 +31,28 @@ def update_schedule_files():
     print("🔄 Файлы расписания обновлены!")
 
 
+def install_schedule_file(new_file, file_path, backup_dir="backup"):
+    """
+    Атомарно подменяет файл расписания новым: старый уходит в backup,
+    новый копируется рядом с целевым и переименовывается через os.replace.
+    Читатели видят либо старый файл целиком, либо новый.
+    """
+    os.makedirs(backup_dir, exist_ok=True)
+    if os.path.exists(file_path):
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        backup_name = f"{backup_dir}/{os.path.basename(file_path)}_{timestamp}.backup"
+        shutil.copy2(file_path, backup_name)
+
+    target_dir = os.path.dirname(file_path)
+    if target_dir:
+        os.makedirs(target_dir, exist_ok=True)
+
+    # Временный файл в той же папке — иначе os.replace не атомарен (разные диски)
+    tmp_path = f"{file_path}.uploading"
+    shutil.copyfile(new_file, tmp_path)
+    os.replace(tmp_path, file_path)
+    print(f"✅ Обновлен: {file_path}")
+
+
 if __name__ == "__main__":
     update_schedule_files()